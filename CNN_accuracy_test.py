@@ -20,35 +20,36 @@ def evaluate_model(model, data_loader, device='cuda'):
         dict: 包含各种评估指标的字典
     """
     model.eval()
-    all_preds = []
-    all_labels = []
-    correct = 0
-    total = 0
     
-    # 用于记录每个类别的统计信息
-    class_correct = [0] * 3
-    class_total = [0] * 3
+    # 预分配结果数组, 避免逐元素append到Python列表
+    n_samples = len(data_loader.dataset)
+    all_preds = np.empty(n_samples, dtype=np.int64)
+    all_labels = np.empty(n_samples, dtype=np.int64)
+    offset = 0
     
     with torch.no_grad():
         for inputs, labels in data_loader:
-            inputs, labels = inputs.to(device), labels.to(device)
+            inputs = inputs.to(device)
             outputs = model(inputs)
             _, predicted = outputs.max(1)
             
-            # 统计总体准确度
-            total += labels.size(0)
-            correct += predicted.eq(labels).sum().item()
-            
-            # 统计每个类别的准确度
-            for i in range(len(labels)):
-                label = labels[i]
-                class_total[label] += 1
-                if predicted[i] == label:
-                    class_correct[label] += 1
-            
             # 保存预测结果用于详细分析
-            all_preds.extend(predicted.cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
+            batch_len = labels.size(0)
+            all_preds[offset:offset + batch_len] = predicted.cpu().numpy()
+            all_labels[offset:offset + batch_len] = labels.numpy()
+            offset += batch_len
+    
+    all_preds = all_preds[:offset]
+    all_labels = all_labels[:offset]
+    
+    # 统计总体准确度
+    hits = all_preds == all_labels
+    total = offset
+    correct = int(hits.sum())
+    
+    # 统计每个类别的准确度
+    class_total = np.bincount(all_labels, minlength=3)
+    class_correct = np.bincount(all_labels[hits], minlength=3)
     
     # 计算各项指标
     overall_accuracy = 100. * correct / total
@@ -105,10 +106,12 @@ def plot_results(results, save_path=None):
     
     plt.tight_layout()
     
-    # 保存图表
+    # 保存图表; 只有未指定保存路径时才弹出交互窗口
     if save_path:
         plt.savefig(save_path)
-    plt.show()
+        plt.close()
+    else:
+        plt.show()
 
 def test_model(model, train_loader, test_loader, save_dir='./results'):
     """
@@ -194,9 +194,8 @@ def download_and_prepare_data(symbol, start_date, end_date, window=21):
     return stock
 
 def load_data_from_csv(file_path):
-    data = pd.read_csv(file_path)
-    data['Date'] = pd.to_datetime(data['Date'])
-    data.set_index('Date', inplace=True)
+    # 读取时解析Date列并设为索引(DatetimeIndex), 省去单独的to_datetime/set_index
+    data = pd.read_csv(file_path, parse_dates=['Date'], index_col='Date')
     return data
 
 if __name__ == "__main__":
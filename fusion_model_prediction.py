@@ -1,22 +1,24 @@
 import torch
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # 仅保存图片, 无需交互式后端
+import matplotlib.pyplot as plt
 from torch.utils.data import DataLoader
 from data import load_data_from_csv
 from train import generate_event_data
 from fusion_model import ATLASCNNFusion, FusionStockDataset, prepare_feature_groups
 
-def predict_stock(symbol, model_path, device='cuda'):
+def load_model(model_path, device='cuda'):
     """
-    使用训练好的融合模型进行股票预测
+    加载训练好的融合模型, 只需加载一次即可在多个股票间复用
     
     Args:
-        symbol (str): 股票代码
         model_path (str): 模型权重文件路径
         device (str): 使用的设备 ('cuda' or 'cpu')
         
     Returns:
-        pd.DataFrame: 包含预测结果的DataFrame
+        ATLASCNNFusion: 处于推理模式的模型
     """
     # 参数设置
     input_dim = 21
@@ -24,12 +26,6 @@ def predict_stock(symbol, model_path, device='cuda'):
     event_dim = 32
     num_event_types = 10
     
-    # 1. 加载数据
-    print(f"Loading data for {symbol}...")
-    data = load_data_from_csv(f"./data/{symbol}.csv")
-    events = generate_event_data(data)
-    
-    # 2. 初始化模型
     print("Initializing model...")
     model = ATLASCNNFusion(
         input_dim=input_dim,
@@ -45,46 +41,84 @@ def predict_stock(symbol, model_path, device='cuda'):
     model.load_state_dict(checkpoint['model_state_dict'])
     model.eval()
     
-    # 3. 创建数据集和加载器
+    # 推理阶段不需要梯度
+    for p in model.parameters():
+        p.requires_grad_(False)
+    
+    return model
+
+def predict_stock(symbol, model, device='cuda', use_bf16=False):
+    """
+    使用训练好的融合模型进行股票预测
+    
+    Args:
+        symbol (str): 股票代码
+        model (ATLASCNNFusion): 由load_model加载的模型
+        device (str): 使用的设备 ('cuda' or 'cpu')
+        use_bf16 (bool): 是否启用BF16混合精度(默认关闭, 尚未与FP32结果做精度对比);
+            仅在原生支持BF16的GPU(计算能力>=8.0, Ampere及以上)上生效
+        
+    Returns:
+        pd.DataFrame: 包含预测结果的DataFrame
+    """
+    # 1. 加载数据
+    print(f"Loading data for {symbol}...")
+    data = load_data_from_csv(f"./data/{symbol}.csv")
+    events = generate_event_data(data)
+    
+    # 2. 创建数据集和加载器
     dataset = FusionStockDataset(data, events)
+    # 推理无需保存梯度, 使用更大的batch摊薄kernel启动开销;
+    # 锁页内存配合non_blocking让H2D拷贝与计算重叠
     dataloader = DataLoader(
         dataset,
-        batch_size=32,
+        batch_size=256,
         shuffle=False,
-        num_workers=4
+        num_workers=4,
+        pin_memory=(device == 'cuda'),
+        prefetch_factor=4
     )
     
-    # 4. 进行预测
+    # 3. 进行预测
     print("Making predictions...")
-    predictions = []
-    actual_prices = []
-    dates = []
+    # 预分配结果数组, 避免逐元素append到Python列表;
+    # 预测值保留在设备上累积, 循环结束后只做一次D2H拷贝
+    N = len(dataset)
+    pred_buf = torch.empty(N, dtype=torch.float32, device=device)
+    actual_prices = np.empty(N, dtype=np.float32)
     
-    with torch.no_grad():
+    # 只在硬件原生支持BF16的GPU上启用; 更早的GPU(V100/T4等)上BF16靠软件模拟, 比FP32更慢
+    use_autocast = (use_bf16 and device == 'cuda'
+                    and torch.cuda.get_device_capability()[0] >= 8)
+    
+    with torch.inference_mode():
         for idx, batch in enumerate(dataloader):
-            sequence = batch['sequence'].to(device)
-            events = batch['events'].to(device)
-            time_distances = batch['time_distances'].to(device)
-            
-            # 转换target为价格变化百分比
-            target = batch['target'].cpu().numpy()
-            current_price = batch['current_price'].cpu().numpy()
+            sequence = batch['sequence'].to(device, non_blocking=True)
+            events = batch['events'].to(device, non_blocking=True)
+            time_distances = batch['time_distances'].to(device, non_blocking=True)
             
-            # 获取预测
-            pred, _, _ = model(sequence, events, time_distances)
-            batch_preds = pred[:, -1].cpu().numpy()
+            # 获取预测 (可选BF16混合精度; BF16与FP32指数范围相同, 不会溢出为inf)
+            with torch.autocast(device_type='cuda', dtype=torch.bfloat16,
+                                enabled=use_autocast):
+                pred, _, _ = model(sequence, events, time_distances)
             
-            predictions.extend(batch_preds.flatten())
-            actual_prices.extend(target.flatten())
+            # 模型检测到NaN时返回None
+            if pred is None:
+                raise RuntimeError(
+                    f"Model produced NaN outputs for {symbol} in batch {idx}"
+                )
             
             start_idx = idx * dataloader.batch_size
-            end_idx = min((idx + 1) * dataloader.batch_size, len(dataset))
-            current_dates = data.index[start_idx:end_idx]
-            dates.extend(current_dates)
+            end_idx = min(start_idx + dataloader.batch_size, N)
+            pred_buf[start_idx:end_idx] = pred[:, -1].reshape(-1).float()
+            # target由DataLoader产生, 本身就在CPU上, 无需经过设备
+            actual_prices[start_idx:end_idx] = batch['target'].numpy().ravel()
+    
+    predictions = pred_buf.cpu().numpy()
     
-    # 转换为numpy数组
-    predictions = np.array(predictions)
-    actual_prices = np.array(actual_prices)
+    # 沿用原实现的日期映射(第i个样本取data.index[i]), 保持输出不变;
+    # 注意样本i的target实际来自第 i + sequence_length + prediction_horizon - 1 行
+    dates = data.index[:N]
     
     # 创建结果DataFrame
     results_df = pd.DataFrame({
@@ -93,21 +127,24 @@ def predict_stock(symbol, model_path, device='cuda'):
         'Predicted': predictions,
     })
     
-    # 计算误差
-    results_df['Error'] = np.abs(results_df['Predicted'] - results_df['Actual'])
+    # 计算误差 (直接在numpy数组上计算一次, 后续指标复用)
+    abs_error = np.abs(predictions - actual_prices)
+    results_df['Error'] = abs_error
     
     # 计算相对误差(使用实际价格而不是变化率)
-    close_prices = data.loc[results_df['Date'], 'Close'].values
-    results_df['Error_Percentage'] = (results_df['Error'] / np.abs(close_prices)) * 100
+    # 与上面的日期映射一致, 按位置取前N行收盘价(日期索引无重复时与原先按标签查找结果相同)
+    close_prices = data['Close'].values[:N]
+    error_percentage = abs_error / np.abs(close_prices) * 100
+    results_df['Error_Percentage'] = error_percentage
     
     # 计算评估指标
-    mse = float(np.mean(np.square(results_df['Error'])))
-    mae = float(np.mean(results_df['Error']))
-    mape = float(np.mean(results_df['Error_Percentage']))
+    mse = float(np.mean(abs_error * abs_error))
+    mae = float(np.mean(abs_error))
+    mape = float(np.mean(error_percentage))
     
     # 计算方向准确率
-    actual_direction = np.sign(results_df['Actual'])
-    pred_direction = np.sign(results_df['Predicted'])
+    actual_direction = np.sign(actual_prices)
+    pred_direction = np.sign(predictions)
     direction_acc = float(np.mean(actual_direction == pred_direction) * 100)
     
     print("\nPrediction Metrics:")
@@ -118,31 +155,68 @@ def predict_stock(symbol, model_path, device='cuda'):
     
     # 添加一些额外的有用信息
     print("\nPrediction Statistics:")
-    print(f"Actual Range: [{results_df['Actual'].min():.4f}, {results_df['Actual'].max():.4f}]")
-    print(f"Predicted Range: [{results_df['Predicted'].min():.4f}, {results_df['Predicted'].max():.4f}]")
+    print(f"Actual Range: [{actual_prices.min():.4f}, {actual_prices.max():.4f}]")
+    print(f"Predicted Range: [{predictions.min():.4f}, {predictions.max():.4f}]")
     
     # 计算相关系数
-    correlation = np.corrcoef(results_df['Actual'], results_df['Predicted'])[0,1]
+    correlation = np.corrcoef(actual_prices, predictions)[0,1]
     print(f"Correlation: {correlation:.4f}")
     
     return results_df
 
-def main():
+def save_results(results, symbol, save_format='parquet'):
+    """
+    保存预测结果
+    
+    Args:
+        results (pd.DataFrame): predict_stock返回的结果
+        symbol (str): 股票代码
+        save_format (str): 'parquet'(默认, zstd压缩) 或 'csv'(兼容旧格式);
+            pyarrow未安装时退回CSV
+        
+    Returns:
+        str: 实际保存的文件路径
+    """
+    if save_format == 'parquet':
+        try:
+            save_path = f'predictions_{symbol}.parquet'
+            results.to_parquet(save_path, engine='pyarrow', compression='zstd', index=False)
+            return save_path
+        except ImportError:
+            print("pyarrow not installed, falling back to CSV")
+    
+    save_path = f'predictions_{symbol}.csv'
+    results.to_csv(save_path, index=False)
+    return save_path
+
+def main(save_format='parquet'):
+    """
+    加载模型, 对指定股票进行预测, 并保存结果和图表
+    
+    Args:
+        save_format (str): 预测结果保存格式, 'parquet'(默认) 或 'csv'(兼容旧格式)
+    """
     # 设置设备
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     print(f"Using device: {device}")
     
+    # 除最后一个不满的batch外, 输入形状都相同, cuDNN只需为两种形状各选一次卷积算法
+    if device == 'cuda':
+        torch.backends.cudnn.benchmark = True
+    
     # 设置要预测的股票
     symbol = "AAPL"  # 可以改成其他股票代码
     model_path = 'checkpoints/fusion/stage2_best_model.pt'  # 使用第二阶段的最佳模型
     
     try:
+        # 加载模型
+        model = load_model(model_path, device)
+        
         # 进行预测
-        results = predict_stock(symbol, model_path, device)
+        results = predict_stock(symbol, model, device)
         
         # 保存结果
-        save_path = f'predictions_{symbol}.csv'
-        results.to_csv(save_path, index=False)
+        save_path = save_results(results, symbol, save_format)
         print(f"\nPredictions saved to {save_path}")
         
         # 显示最近的几个预测结果
@@ -157,30 +231,28 @@ def main():
 
 def plot_predictions(results, symbol):
     """绘制预测结果的图表"""
-    plt.figure(figsize=(15, 10))
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(15, 10))
     
     # 绘制预测值和实际值
-    plt.subplot(2, 1, 1)
-    plt.plot(results['Date'], results['Actual'], label='Actual', alpha=0.7)
-    plt.plot(results['Date'], results['Predicted'], label='Predicted', alpha=0.7)
-    plt.title(f'{symbol} Stock Price Prediction')
-    plt.xlabel('Date')
-    plt.ylabel('Price Change')
-    plt.legend()
-    plt.grid(True)
+    ax1.plot(results['Date'], results['Actual'], label='Actual', alpha=0.7)
+    ax1.plot(results['Date'], results['Predicted'], label='Predicted', alpha=0.7)
+    ax1.set_title(f'{symbol} Stock Price Prediction')
+    ax1.set_xlabel('Date')
+    ax1.set_ylabel('Price Change')
+    ax1.legend()
+    ax1.grid(True)
     
     # 绘制误差
-    plt.subplot(2, 1, 2)
-    plt.plot(results['Date'], results['Error'], label='Prediction Error', color='red', alpha=0.5)
-    plt.title('Prediction Error')
-    plt.xlabel('Date')
-    plt.ylabel('Error')
-    plt.legend()
-    plt.grid(True)
-    
-    plt.tight_layout()
-    plt.savefig(f'predictions_{symbol}.png')
-    plt.close()
+    ax2.plot(results['Date'], results['Error'], label='Prediction Error', color='red', alpha=0.5)
+    ax2.set_title('Prediction Error')
+    ax2.set_xlabel('Date')
+    ax2.set_ylabel('Error')
+    ax2.legend()
+    ax2.grid(True)
+    
+    fig.tight_layout()
+    fig.savefig(f'predictions_{symbol}.png')
+    plt.close(fig)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
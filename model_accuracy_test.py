@@ -1,3 +1,4 @@
+import sys
 import torch
 import numpy as np
 import pandas as pd
@@ -153,18 +154,19 @@ def test_direction_prediction(model_path, symbols=['AAPL', 'MSFT', 'GOOGL'],
     print("Preparing test data...")
     _, test_data, _, test_events = prepare_test_data(symbols)
     
+    # 设置设备
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    
     # 创建测试数据集
     test_dataset = EnhancedStockDataset(test_data, test_events)
     test_loader = DataLoader(
         test_dataset,
         batch_size=batch_size,
         shuffle=False,
-        num_workers=4
+        num_workers=4,
+        pin_memory=(device.type == 'cuda')
     )
     
-    # 设置设备
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    
     # 加载模型
     print("Loading model...")
     model = EnhancedStockPredictor(
@@ -178,19 +180,24 @@ def test_direction_prediction(model_path, symbols=['AAPL', 'MSFT', 'GOOGL'],
     model.load_state_dict(torch.load(model_path))
     model.eval()
     
-    # 收集预测结果
-    all_predictions = []
-    all_targets = []
-    all_prev_prices = []
+    # 收集预测结果: 在设备上预分配, 循环结束后统一拷回CPU;
+    # target只在CPU上使用, 直接写入CPU数组, 不经过设备
+    n_samples = len(test_dataset)
+    all_predictions = torch.empty(n_samples, device=device)
+    all_targets = np.empty(n_samples, dtype=np.float32)
+    all_prev_prices = torch.empty(n_samples, device=device)
     
     print("Running predictions...")
+    # 降低进度条刷新频率, 非终端环境(脚本/日志)下直接关闭
+    pbar = tqdm(test_loader, mininterval=0.5,
+                miniters=max(1, len(test_loader) // 100),
+                disable=not sys.stderr.isatty())
     with torch.no_grad():
-        for sequence, events, time_distances, target in tqdm(test_loader):
-            # 移动数据到设备
-            sequence = sequence.to(device)
-            events = events.to(device)
-            time_distances = time_distances.to(device)
-            target = target.to(device)
+        for batch_idx, (sequence, events, time_distances, target) in enumerate(pbar):
+            # 移动数据到设备 (锁页内存上的异步拷贝)
+            sequence = sequence.to(device, non_blocking=True)
+            events = events.to(device, non_blocking=True)
+            time_distances = time_distances.to(device, non_blocking=True)
             
             # 获取前一天的收盘价
             prev_price = sequence[:, -1, 3]
@@ -200,16 +207,18 @@ def test_direction_prediction(model_path, symbols=['AAPL', 'MSFT', 'GOOGL'],
             final_predictions = predictions[:, -1, 0]
             
             # 收集结果
-            all_predictions.extend(final_predictions.cpu().numpy())
-            all_targets.extend(target.squeeze().cpu().numpy())
-            all_prev_prices.extend(prev_price.cpu().numpy())
+            start = batch_idx * batch_size
+            end = start + target.size(0)
+            all_predictions[start:end] = final_predictions
+            all_targets[start:end] = target.reshape(-1).numpy()
+            all_prev_prices[start:end] = prev_price
     
     # 计算指标
     print("\nCalculating metrics...")
     metrics = calculate_direction_metrics(
-        np.array(all_predictions),
-        np.array(all_targets),
-        np.array(all_prev_prices),
+        all_predictions.cpu().numpy(),
+        all_targets,
+        all_prev_prices.cpu().numpy(),
         threshold
     )
     